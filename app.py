@@ -1,46 +1,66 @@
 import sqlite3
+import pandas as pd
 import streamlit as st
 from pathlib import Path
+from src.database.db_manager import APP_DB, DatabaseManager
 
-# Definir rutas de las bases de datos
-DATA_DIR = Path("data/processed")
-INTERACTIONS_DB = DATA_DIR / "interactions.db"
-ORDERS_DB = DATA_DIR / "orders.db"
+# Número de filas por página en las tablas
+PAGE_SIZE = 500
+
+@st.cache_resource
+def get_connection(path: Path) -> sqlite3.Connection:
+    """
+    Abre la conexión a la base de datos una sola vez y la reutiliza entre reruns.
+    La conexión es de solo lectura: la app únicamente consulta el historial.
+    """
+    # Crear tablas (y migrar las bases anteriores) si el agente aún no lo hizo
+    DatabaseManager(read_pool_size=1).close()
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA query_only=1")
+    return conn
+
+@st.cache_data(ttl="30s")
+def load_interactions(offset: int = 0) -> pd.DataFrame:
+    """Carga una página de conversaciones, de la más reciente a la más antigua."""
+    return pd.read_sql_query(
+        "SELECT interaction_id AS ID, query AS Consulta, response AS Respuesta, timestamp AS Fecha "
+        "FROM interactions ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+        get_connection(APP_DB),
+        params=(PAGE_SIZE, offset)
+    )
+
+@st.cache_data(ttl="30s")
+def load_orders(offset: int = 0) -> pd.DataFrame:
+    """Carga una página de pedidos, del más reciente al más antiguo."""
+    return pd.read_sql_query(
+        "SELECT order_id AS 'ID del Pedido', product_id AS 'ID del Producto', quantity AS Cantidad, "
+        "timestamp AS Fecha, status AS Estado "
+        "FROM orders ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+        get_connection(APP_DB),
+        params=(PAGE_SIZE, offset)
+    )
+
+def page_offset(key: str) -> int:
+    """Muestra un selector de página y devuelve el OFFSET correspondiente."""
+    page = st.number_input("Página", min_value=1, value=1, step=1, key=key)
+    return (int(page) - 1) * PAGE_SIZE
 
 # Título de la aplicación
 st.title("Revisión de Conversaciones y Pedidos")
 
 # Mostrar conversaciones
 st.header("Conversaciones")
-conn = sqlite3.connect(INTERACTIONS_DB)
-cursor = conn.cursor()
-cursor.execute("SELECT interaction_id, query, response, timestamp FROM interactions ORDER BY timestamp DESC")
-conversaciones = cursor.fetchall()
-if conversaciones:
-    for conv in conversaciones:
-        st.write(f"**ID:** {conv[0]}")
-        st.write(f"**Consulta:** {conv[1]}")
-        st.write(f"**Respuesta:** {conv[2]}")
-        st.write(f"**Fecha:** {conv[3]}")
-        st.write("---")
+conversaciones = load_interactions(page_offset("interactions_page"))
+if not conversaciones.empty:
+    st.dataframe(conversaciones, use_container_width=True, hide_index=True)
 else:
     st.write("No hay conversaciones registradas.")
-conn.close()
 
 # Mostrar pedidos
 st.header("Pedidos Registrados")
-conn = sqlite3.connect(ORDERS_DB)
-cursor = conn.cursor()
-cursor.execute("SELECT order_id, product_id, quantity, timestamp, status FROM orders ORDER BY timestamp DESC")
-pedidos = cursor.fetchall()
-if pedidos:
-    for ped in pedidos:
-        st.write(f"**ID del Pedido:** {ped[0]}")
-        st.write(f"**ID del Producto:** {ped[1]}")
-        st.write(f"**Cantidad:** {ped[2]}")
-        st.write(f"**Fecha:** {ped[3]}")
-        st.write(f"**Estado:** {ped[4]}")
-        st.write("---")
+pedidos = load_orders(page_offset("orders_page"))
+if not pedidos.empty:
+    st.dataframe(pedidos, use_container_width=True, hide_index=True)
 else:
     st.write("No hay pedidos registrados.")
-conn.close()
\ No newline at end of file
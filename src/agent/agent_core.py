@@ -1,35 +1,230 @@
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import TYPE_CHECKING, Optional, Tuple
+from functools import lru_cache
+from collections import OrderedDict
+from types import MappingProxyType
 import os
 import json
 import re
 import logging
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
+import threading
 from dotenv import load_dotenv
-from pydantic import SecretStr
-from langchain.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_community.chat_message_histories import ChatMessageHistory
-from src.database.db_manager import DatabaseManager
-from src.agent.llm_handler import LLMHandler
+from src.agent.query_cache import QueryCache
+from src.database.db_manager import get_db_manager
 
-# Configurar logging para depuración y seguimiento
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# Los módulos de langchain/openai se importan dentro de las funciones que los usan
+# para no pagar su carga (numpy, faiss, tiktoken...) al importar este módulo.
+if TYPE_CHECKING:
+    from src.agent.llm_handler import LLMHandler
+    from src.database.db_manager import DatabaseManager
+    from langchain_openai import OpenAIEmbeddings
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.chat_message_histories import ChatMessageHistory
 
 # Cargar variables de entorno desde .env
 load_dotenv(override=True)
 
+# Configurar logging (INFO por defecto; LOG_LEVEL=DEBUG para depuración)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format='%(asctime)s - %(levelname)s - %(message)s')
+
 # Definir rutas de archivos y directorios
 VECTOR_DIR = Path("data/processed/vectordb")
 CATALOG_PATH = Path("data/processed/catalog.json")
 
-# Almacenar historial de conversaciones por usuario
-chat_histories = {}
+# Patrones precompilados para la extracción de pedidos
+_ORDER_KW = re.compile(r"\b(quiero|pedir|comprar|dame|necesito)\b", re.IGNORECASE)
+_QTY = re.compile(r"\b(\d+|un|una|dos|tres|cuatro|cinco|media|mitad)\b")
+_STRIP = re.compile(
+    r"\b(quiero|pedir|comprar|dame|necesito|\d+|un|una|dos|tres|cuatro|cinco|media|mitad"
+    r"|de|el|la|los|las|y|por|para|a)\b"
+)
+_PUNCT = re.compile(r"[^\w\s]")
+_TOKEN = re.compile(r"[\w-]+")
+_NUM_MAP = MappingProxyType({"un": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5})
+
+# Sección de cada fuente, para documentos indexados antes de guardar "section" en los metadatos
+_SOURCE_SECTION = MappingProxyType({"catalog": "producto", "faqs": "faq"})
+
+# Distancia máxima para aceptar un producto encontrado por búsqueda semántica
+PRODUCT_MATCH_THRESHOLD = 0.8
+
+# Palabras clave para enrutar consultas de pedidos, productos y FAQs. Se comparan como prefijo
+# de cada palabra de la consulta, así "reserva" acepta "reservar" y "pan" acepta "panadería".
+_ORDER_KW_SET = frozenset({"quiero", "pedir", "comprar", "dame", "necesito"})
+_PRODUCT_KW = frozenset({"integral", "croissant", "galleta", "chocolate", "torta", "pan"})
+_FAQ_KW = frozenset({
+    "horario", "gluten", "domicilio", "pago", "personalizado", "café", "fresco",
+    "vegano", "reserv", "wi-fi", "bebida", "diabético", "ubica", "tipo", "cumpleaño"
+})
+# Tabla única prefijo -> categoría: una pasada por los tokens resuelve todas las ramas
+_KEYWORD_CATEGORY = MappingProxyType({
+    **{kw: "pedido" for kw in _ORDER_KW_SET},
+    **{kw: "producto" for kw in _PRODUCT_KW},
+    **{kw: "faq" for kw in _FAQ_KW},
+})
+_KEYWORD_LENGTHS = tuple(sorted({len(kw) for kw in _KEYWORD_CATEGORY}))
+
+# Almacenar historial de conversaciones por usuario (LRU acotado por sesiones y mensajes)
+MAX_SESSIONS = 10_000
+MAX_HISTORY_MESSAGES = 40
+chat_histories: "OrderedDict[str, ChatMessageHistory]" = OrderedDict()
+_chat_histories_lock = threading.Lock()
+
+# Caché de respuestas finales (producto/FAQ/LLM sin historial); los pedidos nunca se guardan.
+# Cada entrada es (respuesta, sin_historial).
+QUERY_CACHE_SIZE = 2000
+QUERY_CACHE_TTL_SECONDS = 300
+_query_cache = QueryCache(max_size=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL_SECONDS)
+
+# Caché negativa de búsquedas semánticas (producto/FAQ) sin resultado por consulta normalizada,
+# para no repetir el embedding y la búsqueda. Los aciertos se guardan solo en _query_cache.
+_miss_cache = QueryCache(max_size=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL_SECONDS)
+
+def _normalize(consulta: str) -> str:
+    """
+    Normaliza una consulta para usarla como clave de caché: minúsculas, sin puntuación
+    y con espacios colapsados.
+    """
+    texto = _PUNCT.sub(" ", consulta.lower())
+    return " ".join(texto.split())
+
+def _tokenize(consulta_lower: str) -> set[str]:
+    """
+    Separa la consulta en palabras (las palabras con guion, como "wi-fi", se conservan enteras).
+    """
+    return set(_TOKEN.findall(consulta_lower))
+
+def _route(tokens: set[str]) -> set[str]:
+    """
+    Clasifica la consulta en una sola pasada por sus tokens: un token pertenece a una categoría
+    si alguna palabra clave es prefijo suyo ("horarios", "reservar", "panadería"...).
+
+    Returns:
+        set[str]: Categorías detectadas ("pedido", "producto", "faq").
+    """
+    hits = set()
+    for token in tokens:
+        for length in _KEYWORD_LENGTHS:
+            if length > len(token):
+                break
+            category = _KEYWORD_CATEGORY.get(token[:length])
+            if category:
+                hits.add(category)
+    return hits
 
-def get_session_history(session_id: str) -> ChatMessageHistory:
+def _section(doc) -> Optional[str]:
+    """
+    Devuelve la sección ("producto" o "faq") de un documento del vector store a partir de sus metadatos.
+    """
+    return doc.metadata.get("section") or _SOURCE_SECTION.get(doc.metadata.get("source"))
+
+def _cached_search(section: str, consulta: str, search) -> Optional[str]:
+    """
+    Ejecuta `search` salvo que la misma búsqueda ya haya quedado sin resultados, y recuerda
+    las búsquedas sin resultados para no repetirlas.
+
+    Args:
+        section (str): Rama de búsqueda ("producto" o "faq").
+        consulta (str): Texto de la consulta del usuario.
+        search: Función sin argumentos que realiza la búsqueda semántica.
+
+    Returns:
+        str: Respuesta encontrada, o None si la búsqueda no tuvo resultados.
+    """
+    key = (section, _normalize(consulta))
+    if _miss_cache.get(key):
+        logging.debug("Búsqueda sin resultados en caché para: %s", key)
+        return None
+    response = search()
+    if response is None:
+        _miss_cache.put(key, True)
+    return response
+
+def clear_caches():
+    """
+    Vacía las cachés de respuestas y de búsquedas sin resultados.
+    """
+    _query_cache.clear()
+    _miss_cache.clear()
+
+# Recursos compartidos por el proceso, inicializados una sola vez bajo lock
+_EMBEDDINGS: Optional["OpenAIEmbeddings"] = None
+_VECTORDB: Optional["FAISS"] = None
+_LLM: Optional["LLMHandler"] = None
+_resources_lock = threading.RLock()
+
+def _get_embeddings() -> "OpenAIEmbeddings":
+    """
+    Crea una única instancia de OpenAIEmbeddings por proceso.
+
+    Raises:
+        ValueError: Si OPENAI_API_KEY no está definida.
+    """
+    global _EMBEDDINGS
+    if _EMBEDDINGS is None:
+        with _resources_lock:
+            if _EMBEDDINGS is None:
+                from langchain_openai import OpenAIEmbeddings
+                from pydantic import SecretStr
+                from src.agent.llm_handler import HTTP_CLIENT
+
+                api_key = os.getenv("OPENAI_API_KEY")
+                if not api_key:
+                    raise ValueError("OPENAI_API_KEY no encontrada en .env")
+                _EMBEDDINGS = OpenAIEmbeddings(api_key=SecretStr(api_key), http_client=HTTP_CLIENT)
+    return _EMBEDDINGS
+
+def _get_vectordb() -> "FAISS":
+    """
+    Carga el vector store desde disco una sola vez y lo reutiliza entre consultas.
+    """
+    global _VECTORDB
+    if _VECTORDB is None:
+        with _resources_lock:
+            if _VECTORDB is None:
+                import faiss
+                from langchain_community.vectorstores import FAISS
+
+                # Hilos OpenMP de FAISS: la mitad de los núcleos deja CPU libre para atender otras consultas
+                faiss.omp_set_num_threads(int(os.getenv("FAISS_THREADS", max(1, (os.cpu_count() or 2) // 2))))
+                _VECTORDB = FAISS.load_local(str(VECTOR_DIR), _get_embeddings(), allow_dangerous_deserialization=True)
+    return _VECTORDB
+
+def _get_llm_handler() -> "LLMHandler":
+    """
+    Crea un único LLMHandler por proceso.
+
+    Raises:
+        ValueError: Si OPENAI_API_KEY no está definida.
+    """
+    global _LLM
+    if _LLM is None:
+        with _resources_lock:
+            if _LLM is None:
+                from src.agent.llm_handler import LLMHandler
+
+                _LLM = LLMHandler()
+    return _LLM
+
+def warm_up():
+    """
+    Carga por adelantado la base de datos, el catálogo y el vector store para que la primera
+    consulta no pague su carga. Los errores del vector store se registran sin propagarse; la
+    consulta volverá a intentarlo.
+    """
+    get_db_manager()
+    _refresh_catalog()
+    _load_catalog()
+    try:
+        _get_vectordb()
+    except Exception as e:
+        logging.error("Error al precargar el vector store: %s", e)
+
+def get_session_history(session_id: str) -> "ChatMessageHistory":
     """
     Obtiene o crea el historial de mensajes para un usuario específico.
+    Descarta la sesión menos reciente al superar MAX_SESSIONS y conserva solo los
+    últimos MAX_HISTORY_MESSAGES mensajes de cada sesión.
 
     Args:
         session_id (str): Identificador único del usuario (e.g., número de teléfono).
@@ -37,93 +232,218 @@ def get_session_history(session_id: str) -> ChatMessageHistory:
     Returns:
         ChatMessageHistory: Objeto que contiene el historial de la conversación.
     """
-    if session_id not in chat_histories:
-        chat_histories[session_id] = ChatMessageHistory()
-    return chat_histories[session_id]
+    from langchain_community.chat_message_histories import ChatMessageHistory
+
+    with _chat_histories_lock:
+        history = chat_histories.get(session_id)
+        if history is None:
+            history = chat_histories[session_id] = ChatMessageHistory()
+            if len(chat_histories) > MAX_SESSIONS:
+                chat_histories.popitem(last=False)
+        else:
+            chat_histories.move_to_end(session_id)
+        if len(history.messages) > MAX_HISTORY_MESSAGES:
+            history.messages = history.messages[-MAX_HISTORY_MESSAGES:]
+        return history
 
 
+def _format_context(messages: list, budget: int = 1000) -> str:
+    """
+    Construye el contexto del prompt con los mensajes más recientes del historial,
+    recorriéndolo desde el final hasta acumular `budget` caracteres.
+
+    Args:
+        messages (list): Mensajes del historial en orden cronológico.
+        budget (int): Número aproximado de caracteres a incluir. Defaults to 1000.
+
+    Returns:
+        str: Mensajes en orden cronológico, uno por línea con prefijo "User:" o "AI:".
+    """
+    out = []
+    total = 0
+    for m in reversed(messages):
+        line = f"{'AI' if m.type == 'ai' else 'User'}: {m.content}"
+        out.append(line)
+        total += len(line) + 1
+        if total >= budget:
+            break
+    return "\n".join(reversed(out))
+
 def extract_order_info(consulta: str) -> Tuple[Optional[str], Optional[int]]:
     """
     Extrae el nombre del producto y la cantidad de una consulta de pedido.
     Soporta frases como "quiero 2 croissants", "dame una torta de chocolate", etc.
     """
-    logging.debug(f"Procesando consulta para pedido: {consulta}")
+    logging.debug("Procesando consulta para pedido: %s", consulta)
 
-    # Palabras clave para detectar pedidos
-    order_keywords = r"\b(quiero|pedir|comprar|dame|necesito)\b"
-    if not re.search(order_keywords, consulta.lower()):
+    # Palabras clave para detectar pedidos (sin copiar la consulta si no es un pedido)
+    if not _ORDER_KW.search(consulta):
         logging.debug("No se encontraron palabras clave de pedido")
         return None, None
 
+    consulta_lower = consulta.lower()
+
     # Extraer cantidad
     quantity: int = 1
-    quantity_match = re.search(r"\b(\d+|un|una|dos|tres|cuatro|cinco|media|mitad)\b", consulta.lower())
+    quantity_match = _QTY.search(consulta_lower)
     if quantity_match:
         num_str = quantity_match.group(1)
-        num_map = {"un": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5}
-        if num_str in num_map:
-            quantity = num_map[num_str]
+        if num_str in _NUM_MAP:
+            quantity = _NUM_MAP[num_str]
         elif num_str.isdigit():
             quantity = int(num_str)
         else:
             quantity = 1
-        logging.debug(f"Cantidad detectada: {quantity}")
+        logging.debug("Cantidad detectada: %s", quantity)
 
-    # Eliminar palabras clave y cantidad de la consulta
-    texto = consulta.lower()
-    texto = re.sub(order_keywords, "", texto)
-    texto = re.sub(r"\b(\d+|un|una|dos|tres|cuatro|cinco|media|mitad)\b", "", texto)
-    texto = re.sub(r"\b(de|el|la|los|las|un|una|y|por|para|a)\b", "", texto)
-    product_name: Optional[str] = texto.strip(" .," )
+    # Eliminar palabras clave, cantidad y artículos en una sola pasada
+    texto = " ".join(_STRIP.sub("", consulta_lower).split())
+    product_name: Optional[str] = texto.strip(" .,")
 
     # Si el resultado es vacío, no se detectó producto
     if not product_name or len(product_name) < 3:
         product_name = None
 
-    logging.debug(f"Nombre del producto detectado: {product_name}")
+    logging.debug("Nombre del producto detectado: %s", product_name)
     return product_name, quantity
 
-def validate_product(product_name: str, vectordb) -> dict | None:
+@lru_cache(maxsize=1)
+def _load_catalog() -> list[dict]:
+    """
+    Lee catalog.json una sola vez (hasta que _refresh_catalog detecte cambios en el archivo).
+
+    Returns:
+        list[dict]: Productos del catálogo, o lista vacía si el archivo no existe.
+    """
+    if not CATALOG_PATH.exists():
+        logging.error("catalog.json no existe")
+        return []
+    return json.loads(CATALOG_PATH.read_text("utf-8")).get("productos", [])
+
+@lru_cache(maxsize=1)
+def _catalog_names() -> list[tuple[str, dict]]:
+    """
+    Precalcula el nombre normalizado (minúsculas, sin "s" final) de cada producto del catálogo.
+
+    Returns:
+        list[tuple[str, dict]]: Pares (nombre normalizado, producto) en el orden del catálogo.
+    """
+    return [(producto.get("nombre", "").lower().rstrip("s"), producto) for producto in _load_catalog()]
+
+@lru_cache(maxsize=1)
+def _catalog_by_name() -> dict[str, dict]:
+    """
+    Indexa los productos del catálogo por su nombre completo en minúsculas.
+    """
+    return {producto.get("nombre", "").lower(): producto for producto in _load_catalog()}
+
+@lru_cache(maxsize=1)
+def _catalog_index() -> dict[str, dict]:
+    """
+    Indexa los productos del catálogo por nombre normalizado.
+    """
+    return dict(_catalog_names())
+
+_catalog_mtime_ns: Optional[int] = None
+
+def _refresh_catalog():
+    """
+    Invalida las cachés del catálogo si catalog.json cambió en disco desde la última lectura.
+    Solo cuesta un stat() por llamada; el archivo se vuelve a leer únicamente cuando cambia.
+    """
+    global _catalog_mtime_ns
+    try:
+        mtime_ns = CATALOG_PATH.stat().st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    if mtime_ns != _catalog_mtime_ns:
+        _catalog_mtime_ns = mtime_ns
+        for cached in (_load_catalog, _catalog_names, _catalog_by_name, _catalog_index):
+            cached.cache_clear()
+
+def validate_product(product_name: str, vectordb=None, strict: bool = False) -> dict | None:
     """
     Valida si el producto existe en catalog.json o vector store con búsqueda semántica.
+    El vector store solo se consulta si el catálogo no tiene coincidencias.
 
     Args:
         product_name (str): Nombre del producto a buscar.
-        vectordb: Vector store para búsqueda semántica.
+        vectordb: Vector store para búsqueda semántica. Defaults to the cached vector store.
+        strict (bool): Si True, solo se busca en el catálogo. Defaults to False.
 
     Returns:
         dict: Detalles del producto si existe, None si no.
     """
-    logging.debug(f"Validando producto: {product_name}")
-    if not CATALOG_PATH.exists():
-        logging.error("catalog.json no existe")
+    logging.debug("Validando producto: %s", product_name)
+    _refresh_catalog()
+    if not _load_catalog():
         return None
-    with CATALOG_PATH.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-        productos = data.get("productos", [])
-        for producto in productos:
-            catalog_name = producto.get("nombre", "").lower().rstrip("s")
-            if product_name.lower() in catalog_name or catalog_name in product_name.lower():
-                logging.debug(f"Producto encontrado en catálogo: {producto['nombre']}")
-                return producto
-    # Búsqueda semántica en vector store con umbral ajustado
-    results = vectordb.similarity_search(product_name, k=1, score_threshold=0.7)
-    if results and results[0].page_content and "Producto:" in results[0].page_content:
-        product_info = results[0].page_content.split("Producto:")[1].split("\n")[0].strip()
-        for producto in productos:
-            if product_info.lower() in producto.get("nombre", "").lower():
-                logging.debug(f"Producto encontrado en vector store: {producto['nombre']}")
+
+    # Coincidencia exacta del nombre normalizado
+    product_name_lower = product_name.lower()
+    producto = _catalog_index().get(product_name_lower.rstrip("s"))
+    if producto:
+        logging.debug("Producto encontrado en catálogo: %s", producto['nombre'])
+        return producto
+
+    # Coincidencia parcial contra los nombres precalculados del catálogo
+    for catalog_name, producto in _catalog_names():
+        if product_name_lower in catalog_name or catalog_name in product_name_lower:
+            logging.debug("Producto encontrado en catálogo: %s", producto['nombre'])
+            return producto
+
+    if strict:
+        logging.debug("Producto no encontrado en catálogo")
+        return None
+
+    # Búsqueda semántica en vector store, aceptada solo si la distancia no supera el umbral
+    if vectordb is None:
+        try:
+            vectordb = _get_vectordb()
+        except Exception as e:
+            logging.error("Error al cargar el vector store: %s", e)
+            return None
+    results = vectordb.similarity_search_with_score_by_vector(_get_embeddings().embed_query(product_name), k=1)
+    if results:
+        doc, score = results[0]
+        if score <= PRODUCT_MATCH_THRESHOLD and _section(doc) == "producto":
+            product_info = doc.page_content.split("Producto:")[1].split("\n")[0].strip()
+            producto = _catalog_by_name().get(product_info.lower())
+            if producto:
+                logging.debug("Producto encontrado en vector store: %s", producto['nombre'])
                 return producto
     logging.debug("Producto no encontrado en catálogo ni vector store")
     return None
 
-def buscar_respuesta(consulta: str, session_id: Optional[str] = None) -> str | None:
+def _finalize(consulta: str, response: str, session_id: Optional[str], db_manager: Optional["DatabaseManager"] = None) -> str:
+    """
+    Registra la interacción y la añade al historial de la sesión.
+
+    Args:
+        consulta (str): Texto de la consulta del usuario.
+        response (str): Respuesta entregada al usuario.
+        session_id (str, optional): Identificador del usuario; sin él no se guarda historial.
+        db_manager (DatabaseManager, optional): Si se indica, registra la interacción en la base de datos.
+
+    Returns:
+        str: La misma respuesta, para poder retornarla directamente.
+    """
+    if db_manager:
+        db_manager.add_interaction(consulta, response)
+    if session_id:
+        history = get_session_history(session_id)
+        history.add_user_message(consulta)
+        history.add_ai_message(response)
+    return response
+
+def buscar_respuesta(consulta: str, session_id: Optional[str] = None, q_vec: Optional[list[float]] = None) -> str | None:
     """
     Procesa la consulta: primero intenta con pedidos/productos, luego FAQs, y finalmente el LLM con historial si aplica.
 
     Args:
         consulta (str): Texto de la consulta del usuario.
         session_id (str, optional): Identificador único del usuario para historial. Defaults to None.
+        q_vec (list[float], optional): Embedding precalculado de la consulta; evita llamar a embed_query. Defaults to None.
 
     Returns:
         str: Respuesta del LLM, FAQ, producto, o confirmación de pedido.
@@ -132,133 +452,161 @@ def buscar_respuesta(consulta: str, session_id: Optional[str] = None) -> str | N
         logging.error("Consulta inválida")
         return None
 
-    logging.info(f"Procesando consulta: {consulta}")
+    logging.info("Procesando consulta: %s", consulta)
 
-    # Inicializar DatabaseManager y LLMHandler
-    db_manager = DatabaseManager()
-    try:
-        llm_handler = LLMHandler()
-    except ValueError as e:
-        logging.error(f"Error al inicializar LLMHandler: {e}")
-        llm_handler = None
+    db_manager = get_db_manager()
 
-    # Obtener API key para OpenAI
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        logging.error("OPENAI_API_KEY no encontrada en .env")
-        return None
+    # Respuesta en caché para consultas repetidas
+    cache_key = _normalize(consulta)
+    cached = _query_cache.get(cache_key)
+    if cached is not None:
+        response, sin_historial = cached
+        # Las respuestas del LLM sin historial no sirven para usuarios con conversación previa
+        if not sin_historial or session_id is None:
+            logging.debug("Respuesta final en caché para: %s", cache_key)
+            return _finalize(consulta, response, session_id, db_manager)
 
-    # Instanciar embeddings
-    embeddings = OpenAIEmbeddings(api_key=SecretStr(api_key))
+    # Tokenizar y clasificar una sola vez para el enrutamiento por palabras clave
+    hits = _route(_tokenize(consulta.lower()))
 
-    # Cargar vector store
-    try:
-        vectordb = FAISS.load_local(str(VECTOR_DIR), embeddings, allow_dangerous_deserialization=True)
-    except Exception as e:
-        logging.error(f"Error al cargar el vector store: {e}")
-        return None
-
-    # Verificar si es un pedido
-    product_name, quantity = extract_order_info(consulta)
+    # Verificar si es un pedido (las comprobaciones baratas van antes de cargar el vector store)
+    product_name, quantity = extract_order_info(consulta) if "pedido" in hits else (None, None)
     if product_name and quantity:
-        logging.debug(f"Intento de pedido: {product_name}, cantidad: {quantity}")
-        # Validar contra catalog.json y vector store
-        producto = validate_product(product_name, vectordb)
+        logging.debug("Intento de pedido: %s, cantidad: %s", product_name, quantity)
+        # Validar contra catalog.json y, solo si no hay coincidencia, el vector store
+        producto = validate_product(product_name)
         if producto:
-            # Guardar pedido en orders.db
-            order_id = db_manager.add_order(product_id=producto["id"], quantity=quantity, status="procesado")
-            response = f"Pedido registrado: {quantity} x {producto['nombre']} por ${producto['precio'] * quantity}. ID del pedido: {order_id}."
-            logging.info(f"Pedido registrado: {response}")
-            db_manager.add_interaction(consulta, response)
-            if session_id:
-                get_session_history(session_id).add_user_message(consulta)
-                get_session_history(session_id).add_ai_message(response)
-            return response
+            # Guardar pedido e interacción en una sola transacción
+            order_id, response = db_manager.add_interaction_and_order(
+                consulta,
+                product_id=producto["id"],
+                quantity=quantity,
+                format_response=lambda order_id: f"Pedido registrado: {quantity} x {producto['nombre']} por ${producto['precio'] * quantity}. ID del pedido: {order_id}.",
+                status="procesado"
+            )
+            logging.info("Pedido registrado: %s", response)
+            # Un pedido modifica el estado: las respuestas en caché dejan de ser fiables
+            clear_caches()
+            return _finalize(consulta, response, session_id)
         else:
             response = f"No encontramos '{product_name}' en nuestro catálogo. ¿Te gustaría consultar algo más o intentarlo con otro producto?"
-            logging.warning(f"Producto no encontrado: {product_name}")
-            db_manager.add_interaction(consulta, response)
-            if session_id:
-                get_session_history(session_id).add_user_message(consulta)
-                get_session_history(session_id).add_ai_message(response)
-            return response
+            logging.warning("Producto no encontrado: %s", product_name)
+            return _finalize(consulta, response, session_id, db_manager)
+
+    # Cargar vector store (en caché tras la primera llamada) solo si alguna rama lo necesita
+    if ("producto" in hits and not product_name) or "faq" in hits:
+        try:
+            vectordb = _get_vectordb()
+        except Exception as e:
+            logging.error("Error al cargar el vector store: %s", e)
+            return None
+
+    # Búsqueda semántica de la consulta: una sola búsqueda top-1 compartida por las ramas de
+    # producto y FAQ, y solo si alguna la necesita (el embedding se calcula también una sola vez)
+    top_match: Optional[list] = None
+
+    def _top_match() -> list:
+        nonlocal q_vec, top_match
+        if top_match is None:
+            if q_vec is None:
+                q_vec = _get_embeddings().embed_query(consulta)
+            top_match = vectordb.similarity_search_with_score_by_vector(q_vec, k=1)
+        return top_match
 
     # Buscar productos solo si no es un pedido
-    product_keywords = ["integral", "croissant", "galletas", "chocolate", "torta", "pan"]
-    if any(keyword in consulta.lower() for keyword in product_keywords) and not product_name:
+    if "producto" in hits and not product_name:
         logging.debug("Buscando producto en vector store")
-        results = vectordb.similarity_search(consulta, k=1, score_threshold=0.8)
-        if results and results[0].page_content and "Producto:" in results[0].page_content:
-            response = results[0].page_content.strip()
-            logging.info(f"Producto encontrado: {response}")
-            db_manager.add_interaction(consulta, response)
-            if session_id:
-                get_session_history(session_id).add_user_message(consulta)
-                get_session_history(session_id).add_ai_message(response)
-            return response
+
+        def _search_producto() -> Optional[str]:
+            results = _top_match()
+            if results and results[0][1] <= 0.8 and _section(results[0][0]) == "producto":
+                return results[0][0].page_content.strip()
+            return None
+
+        response = _cached_search("producto", consulta, _search_producto)
+        if response:
+            logging.info("Producto encontrado: %s", response)
+            _query_cache.put(cache_key, (response, False))
+            return _finalize(consulta, response, session_id, db_manager)
 
     # Buscar en FAQs
-    faq_keywords = [
-        "horario", "gluten", "domicilio", "pago", "personalizado", "café", "fresco",
-        "vegano", "reserva", "wi-fi", "bebida", "diabético", "ubicación"
-    ]
-    if any(keyword in consulta.lower() for keyword in faq_keywords):
+    if "faq" in hits:
         logging.debug("Buscando FAQ en vector store")
-        results = vectordb.similarity_search(consulta, k=1, score_threshold=0.85)
-        if results and results[0].page_content and "R:" in results[0].page_content:
-            response = results[0].page_content.split("R:")[1].strip()
-            logging.info(f"FAQ encontrada: {response}")
-            db_manager.add_interaction(consulta, response)
-            if session_id:
-                get_session_history(session_id).add_user_message(consulta)
-                get_session_history(session_id).add_ai_message(response)
-            return response
+
+        def _search_faq() -> Optional[str]:
+            results = _top_match()
+            if results and results[0][1] <= 0.85 and _section(results[0][0]) == "faq":
+                return results[0][0].page_content.split("R:")[1].strip()
+            return None
+
+        response = _cached_search("faq", consulta, _search_faq)
+        if response:
+            logging.info("FAQ encontrada: %s", response)
+            _query_cache.put(cache_key, (response, False))
+            return _finalize(consulta, response, session_id, db_manager)
+
+    try:
+        llm_handler = _get_llm_handler()
+    except ValueError as e:
+        logging.error("Error al inicializar LLMHandler: %s", e)
+        llm_handler = None
 
     # Consultar el LLM con historial si aplica
     if llm_handler and session_id:
         logging.debug("Consultando LLM con historial")
+        from langchain.prompts import PromptTemplate
+        from langchain_core.runnables import RunnablePassthrough
+
         history = get_session_history(session_id)
         prompt = PromptTemplate(input_variables=["context", "question"], 
                               template="Contexto: {context}\nPregunta: {question}\nRespuesta:")
         chain = (
-            RunnablePassthrough.assign(context=lambda x: "\n".join([f"User: {m.content}" for m in history.messages] + 
-                                                                  [f"AI: {m.content}" for m in history.messages if m.type == "ai"])[-1000:])
+            RunnablePassthrough.assign(context=lambda x: _format_context(history.messages))
             | prompt
             | llm_handler.llm  # Asumiendo que LLMHandler tiene un atributo 'llm'
             | str
         )
         response = chain.invoke({"question": consulta})
-        logging.info(f"Respuesta del LLM: {response}")
-        history.add_user_message(consulta)
-        history.add_ai_message(response)
-        db_manager.add_interaction(consulta, response)
-        return response
+        logging.info("Respuesta del LLM: %s", response)
+        return _finalize(consulta, response, session_id, db_manager)
     elif llm_handler:
         logging.debug("Consultando LLM sin historial")
         response = llm_handler.query_llm(consulta) or ""
-        logging.info(f"Respuesta del LLM: {response}")
-        db_manager.add_interaction(consulta, response)
-        return response
+        logging.info("Respuesta del LLM: %s", response)
+        # query_llm devuelve el mensaje de error como texto; no se guarda en caché
+        if response and not response.startswith("Error al consultar el LLM"):
+            _query_cache.put(cache_key, (response, True))
+        return _finalize(consulta, response, None, db_manager)
     else:
         response = "No se pudo procesar la consulta debido a un error con el LLM."
         logging.error("LLMHandler no disponible")
-        db_manager.add_interaction(consulta, response)
-        return response
+        return _finalize(consulta, response, None, db_manager)
 
-if __name__ == "__main__":
+# Consultas de ejemplo para la prueba básica del agente
+TEST_CONSULTAS = (
+    "¿Cuáles son los horarios de atención?",
+    "¿Tienen opciones sin gluten?",
+    "¿Tienen torta de chocolate?",
+    "Quiero 2 croissants",
+    "Quiero pedir una torta de chocolate",
+    "¿Qué tal el clima?",
+    "¿Puedes recomendar un postre?"
+)
+
+def run_test_consultas(consultas=TEST_CONSULTAS, session_id: str = "test_user"):
+    """
+    Prueba básica del agente: responde e imprime cada consulta de ejemplo.
+
+    Args:
+        consultas (Sequence[str]): Consultas a probar. Defaults to TEST_CONSULTAS.
+        session_id (str): Sesión usada para el historial. Defaults to "test_user".
     """
-    Prueba básica del agente con una lista de consultas de ejemplo.
-    """
-    test_consultas = [
-        "¿Cuáles son los horarios de atención?",
-        "¿Tienen opciones sin gluten?",
-        "¿Tienen torta de chocolate?",
-        "Quiero 2 croissants",
-        "Quiero pedir una torta de chocolate",
-        "¿Qué tal el clima?",
-        "¿Puedes recomendar un postre?"
-    ]
-    for consulta in test_consultas:
-        respuesta = buscar_respuesta(consulta, session_id="test_user")
+    # Un solo request de embeddings para todas las consultas de prueba
+    qvecs = _get_embeddings().embed_documents(list(consultas))
+    for consulta, q_vec in zip(consultas, qvecs):
+        respuesta = buscar_respuesta(consulta, session_id=session_id, q_vec=q_vec)
         print(f"Consulta: {consulta}")
-        print(f"Respuesta: {respuesta or 'No se encontró respuesta'}\n")
\ No newline at end of file
+        print(f"Respuesta: {respuesta or 'No se encontró respuesta'}\n")
+
+if __name__ == "__main__":
+    run_test_consultas()
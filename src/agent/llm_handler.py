@@ -1,25 +1,47 @@
 import os
+import httpx
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
-from src.database.db_manager import DatabaseManager
+from langchain_core.caches import InMemoryCache
+from langchain.globals import set_llm_cache
+from src.database.db_manager import get_db_manager
 
 # Cargar variables de entorno
 load_dotenv(override=True)
 
+# Caché en memoria para respuestas del LLM: consultas repetidas no vuelven a llamar a OpenAI
+set_llm_cache(InMemoryCache(maxsize=1024))
+
+# Cliente HTTP compartido (HTTP/2 con conexiones keep-alive) para no repetir el handshake TLS
+# en cada llamada a OpenAI; lo usan tanto el chat como los embeddings.
+HTTP_CLIENT = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+    timeout=30.0
+)
+
 class LLMHandler:
     """
     Maneja consultas al LLM de OpenAI y registra interacciones.
     """
+    SYSTEM_PROMPT = (
+        "Eres un asistente amigable para una panadería en Bogotá, Colombia. Responde en español, con un tono cálido y profesional. "
+        "Si la consulta es sobre productos, recomienda opciones de nuestro catálogo: Pan Integral ($5000), Torta de Chocolate ($25000), "
+        "Croissant ($3000), Galletas de Avena ($2000). Para preguntas generales, ofrece respuestas útiles y, si no sabes algo "
+        "(e.g., clima), sugiere algo relacionado con la panadería."
+    )
+
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY no encontrada en .env")
         self.model = "gpt-4o" 
-        self.db_manager = DatabaseManager()
+        self.db_manager = get_db_manager()
         self.llm = ChatOpenAI(
             api_key=self.api_key,
             model=self.model,
-            temperature=0.7
+            temperature=0.7,
+            http_client=HTTP_CLIENT
         )
 
     def query_llm(self, consulta: str) -> str | None:
@@ -35,16 +57,9 @@ class LLMHandler:
         if not consulta or not isinstance(consulta, str):
             return None
 
-        system_prompt = (
-            "Eres un asistente amigable para una panadería en Bogotá, Colombia. Responde en español, con un tono cálido y profesional. "
-            "Si la consulta es sobre productos, recomienda opciones de nuestro catálogo: Pan Integral ($5000), Torta de Chocolate ($25000), "
-            "Croissant ($3000), Galletas de Avena ($2000). Para preguntas generales, ofrece respuestas útiles y, si no sabes algo "
-            "(e.g., clima), sugiere algo relacionado con la panadería."
-        )
-
         try:
             response = self.llm.invoke([
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": self.SYSTEM_PROMPT},
                 {"role": "user", "content": consulta}
             ])
             answer = response.content.strip()
@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+class QueryCache:
+    """
+    Caché LRU con expiración (TTL) y segura entre hilos para respuestas del agente.
+    """
+    def __init__(self, max_size: int = 2000, ttl_seconds: float = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Obtiene un valor de la caché si existe y no ha expirado.
+
+        Args:
+            key (Hashable): Clave de la consulta.
+            default (Any): Valor devuelto si la clave no está o expiró. Defaults to None.
+
+        Returns:
+            Any: Valor almacenado, o `default`.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Guarda un valor y descarta la entrada menos reciente si se supera `max_size`.
+
+        Args:
+            key (Hashable): Clave de la consulta.
+            value (Any): Valor a almacenar.
+        """
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Vacía la caché."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
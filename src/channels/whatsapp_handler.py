@@ -1,9 +1,11 @@
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request
 from twilio.twiml.messaging_response import MessagingResponse # type: ignore
 from twilio.rest import Client # type: ignore
 from dotenv import load_dotenv
+import logging
 import os
-from src.agent.agent_core import buscar_respuesta
+from src.agent.agent_core import buscar_respuesta, warm_up
 
 # Cargar variables de entorno
 load_dotenv(override=True)
@@ -17,22 +19,46 @@ if not account_sid or not auth_token:
     raise ValueError("TWILIO_ACCOUNT_SID o TWILIO_AUTH_TOKEN no encontrados en .env")
 client = Client(account_sid, auth_token)
 
+# Precargar catálogo y vector store antes de recibir mensajes
+warm_up()
+
+# Hilos que procesan los mensajes fuera del request de Twilio
+executor = ThreadPoolExecutor(max_workers=int(os.getenv("WHATSAPP_WORKERS", "8")))
+
+def process_and_reply(incoming_msg: str, from_number: str, to_number: str):
+    """
+    Procesa la consulta con el agente y envía la respuesta por la API REST de Twilio.
+
+    Args:
+        incoming_msg (str): Texto recibido.
+        from_number (str): Número del usuario (destinatario de la respuesta).
+        to_number (str): Número de WhatsApp de la panadería (remitente de la respuesta).
+    """
+    try:
+        response_text = buscar_respuesta(incoming_msg, from_number) or "Lo siento, no entendí tu mensaje."
+    except Exception as e:
+        logging.error("Error al procesar mensaje de %s: %s", from_number, e)
+        response_text = "Lo siento, ocurrió un error al procesar tu mensaje."
+    try:
+        client.messages.create(body=response_text, from_=to_number, to=from_number)
+    except Exception as e:
+        logging.error("Error al enviar respuesta a %s: %s", from_number, e)
+
 @app.route("/whatsapp", methods=["POST"])
 def whatsapp_webhook():
     """
-    Maneja mensajes entrantes de WhatsApp y responde usando el agente.
+    Maneja mensajes entrantes de WhatsApp: confirma la recepción de inmediato y delega
+    la respuesta del agente a un hilo de fondo.
     """
     incoming_msg = request.values.get("Body", "").strip()
     from_number = request.values.get("From", "")
+    to_number = request.values.get("To", "")
 
-    # Procesar consulta con el agente
-    response_text = buscar_respuesta(incoming_msg, from_number) or "Lo siento, no entendí tu mensaje."
-
-    # Crear respuesta TwiML
-    resp = MessagingResponse()
-    resp.message(response_text)
+    # Procesar consulta con el agente en segundo plano
+    executor.submit(process_and_reply, incoming_msg, from_number, to_number)
 
-    return str(resp)
+    # Respuesta TwiML vacía: la respuesta real se envía al terminar el procesamiento
+    return str(MessagingResponse())
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    app.run(debug=True, port=5000)
@@ -1,60 +1,88 @@
 from pathlib import Path
-import json
+from typing import Iterator
+import hashlib
+import orjson
 
 PROCESSED_DIR = Path("data/processed")
 CHUNKS_PATH = PROCESSED_DIR / "chunks.jsonl"
+CHUNKS_HASH_PATH = PROCESSED_DIR / "chunks.hash"
+FAQS_PATH = PROCESSED_DIR / "faqs.json"
+CATALOG_PATH = PROCESSED_DIR / "catalog.json"
 
-def create_chunks():
+# Incrementar al cambiar el formato de los chunks para forzar su regeneración
+CHUNK_FORMAT_VERSION = 1
+
+def iter_chunks() -> Iterator[dict]:
     """
-    Convierte las FAQs y el catálogo en chunks y los guarda en chunks.jsonl.
+    Genera los chunks de las FAQs y el catálogo uno a uno, sin acumularlos en memoria.
     Cada chunk es una pregunta+respuesta (FAQs) o descripción de producto (catálogo) con metadatos.
     """
-    faqs_path = PROCESSED_DIR / "faqs.json"
-    catalog_path = PROCESSED_DIR / "catalog.json"
-    chunks = []
-
     # Leer faqs.json
-    if faqs_path.exists():
-        with faqs_path.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-            faqs = data.get("faqs", [])
-            for idx, faq in enumerate(faqs):
-                pregunta = faq.get("pregunta", "").strip()
-                respuesta = faq.get("respuesta", "").strip()
-                if pregunta and respuesta:
-                    chunks.append({
-                        "id": f"faq-{idx}",
-                        "source": "faqs",
-                        "section": "faq",
-                        "text": f"P: {pregunta}\nR: {respuesta}"
-                    })
+    if FAQS_PATH.exists():
+        data = orjson.loads(FAQS_PATH.read_bytes())
+        faqs = data.get("faqs", [])
+        for idx, faq in enumerate(faqs):
+            pregunta = faq.get("pregunta", "").strip()
+            respuesta = faq.get("respuesta", "").strip()
+            if pregunta and respuesta:
+                yield {
+                    "id": f"faq-{idx}",
+                    "source": "faqs",
+                    "section": "faq",
+                    "text": f"P: {pregunta}\nR: {respuesta}"
+                }
 
     # Leer catalog.json
-    if catalog_path.exists():
-        with catalog_path.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-            productos = data.get("productos", [])
-            for idx, producto in enumerate(productos):
-                nombre = producto.get("nombre", "").strip()
-                descripcion = producto.get("descripcion", "").strip()
-                precio = producto.get("precio", 0)
-                categoria = producto.get("categoria", "").strip()
-                product_id = producto.get("id", "").strip()
-                if nombre and descripcion:
-                    chunks.append({
-                        "id": f"producto-{idx}",
-                        "source": "catalog",
-                        "section": "producto",
-                        "text": f"Producto: {nombre}\nDescripción: {descripcion}\nPrecio: ${precio}\nCategoría: {categoria}\nID: {product_id}"
-                    })
-
-    # Guardar chunks en chunks.jsonl
+    if CATALOG_PATH.exists():
+        data = orjson.loads(CATALOG_PATH.read_bytes())
+        productos = data.get("productos", [])
+        for idx, producto in enumerate(productos):
+            nombre = producto.get("nombre", "").strip()
+            descripcion = producto.get("descripcion", "").strip()
+            precio = producto.get("precio", 0)
+            categoria = producto.get("categoria", "").strip()
+            product_id = producto.get("id", "").strip()
+            if nombre and descripcion:
+                yield {
+                    "id": f"producto-{idx}",
+                    "source": "catalog",
+                    "section": "producto",
+                    "text": f"Producto: {nombre}\nDescripción: {descripcion}\nPrecio: ${precio}\nCategoría: {categoria}\nID: {product_id}"
+                }
+
+def _inputs_hash() -> str:
+    """
+    Calcula un hash de faqs.json, catalog.json y la versión del formato de chunks.
+    """
+    h = hashlib.sha256(str(CHUNK_FORMAT_VERSION).encode())
+    for path in (FAQS_PATH, CATALOG_PATH):
+        h.update(path.name.encode())
+        h.update(path.read_bytes() if path.exists() else b"")
+    return h.hexdigest()
+
+def create_chunks(force: bool = False):
+    """
+    Convierte las FAQs y el catálogo en chunks y los escribe en chunks.jsonl a medida que se generan.
+    Si las entradas no cambiaron desde la última ejecución, no vuelve a generarlos.
+
+    Args:
+        force (bool): Si True, regenera los chunks aunque las entradas no hayan cambiado.
+    """
+    inputs_hash = _inputs_hash()
+    if (not force and CHUNKS_PATH.exists() and CHUNKS_HASH_PATH.exists()
+            and CHUNKS_HASH_PATH.read_text("utf-8") == inputs_hash):
+        print(f"Chunks sin cambios en {CHUNKS_PATH}")
+        return
+
     PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
-    with CHUNKS_PATH.open("w", encoding="utf-8") as f:
-        for chunk in chunks:
-            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+    count = 0
+    with CHUNKS_PATH.open("wb") as f:
+        for chunk in iter_chunks():
+            f.write(orjson.dumps(chunk) + b"\n")
+            count += 1
+    CHUNKS_HASH_PATH.write_text(inputs_hash, "utf-8")
 
-    print(f"Generados {len(chunks)} chunks en {CHUNKS_PATH}")
+    print(f"Generados {count} chunks en {CHUNKS_PATH}")
 
 if __name__ == "__main__":
     create_chunks()
\ No newline at end of file
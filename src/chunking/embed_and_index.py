@@ -1,8 +1,14 @@
 from pathlib import Path
-import json
+import hashlib
+import math
 import os
+import sqlite3
+import faiss
+import numpy as np
+import orjson
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain.docstore.document import Document
 from dotenv import load_dotenv
 from pydantic import SecretStr
@@ -12,24 +18,122 @@ load_dotenv(override=True)
 
 CHUNKS_PATH = Path("data/processed/chunks.jsonl")
 VECTOR_DIR = Path("data/processed/vectordb")
+EMB_CACHE_PATH = Path("data/processed/emb_cache.sqlite")
+
+# Tamaño máximo de lote por request de embeddings y de parámetros por consulta SQL
+EMBED_BATCH_SIZE = 512
+SQL_BATCH_SIZE = 900
+
+# A partir de este número de vectores se usa un índice aproximado (ANN) en lugar de búsqueda exhaustiva
+ANN_MIN_VECTORS = 10_000
+# Tipo de índice aproximado: "hnsw" (sin entrenamiento, menor latencia) o "ivf" (menos memoria)
+ANN_INDEX = os.getenv("ANN_INDEX", "hnsw").lower()
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 10
 
 def load_chunks() -> list[Document]:
     """
     Carga los chunks desde chunks.jsonl como documentos de LangChain.
     """
     docs = []
-    with CHUNKS_PATH.open("r", encoding="utf-8") as f:
+    with CHUNKS_PATH.open("rb") as f:
         for line in f:
-            rec = json.loads(line)
+            rec = orjson.loads(line)
             docs.append(Document(
                 page_content=rec["text"],
                 metadata={
                     "id": rec["id"],
                     "source": rec["source"],
+                    "section": rec["section"],
                 }
             ))
     return docs
 
+def build_index(vectors: np.ndarray) -> faiss.Index:
+    """
+    Crea el índice FAISS para los vectores dados, almacenándolos en float16.
+
+    Para catálogos pequeños la búsqueda exhaustiva es exacta y rápida; a partir de
+    ANN_MIN_VECTORS se usa HNSW o IVF (según ANN_INDEX) para que cada búsqueda sea sub-lineal.
+    Todos usan distancia L2, por lo que los umbrales de score del agente no cambian.
+    Guardar en float16 reduce a la mitad el tamaño en disco y la memoria recorrida en cada búsqueda,
+    con pérdida de recall despreciable; las consultas se siguen enviando en float32.
+    """
+    n, dim = vectors.shape
+    if n < ANN_MIN_VECTORS:
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+    elif ANN_INDEX == "ivf":
+        nlist = max(4, int(math.sqrt(n)))
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+        index.nprobe = IVF_NPROBE
+    elif ANN_INDEX == "hnsw":
+        index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_fp16, HNSW_M)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    else:
+        raise ValueError(f"ANN_INDEX desconocido: {ANN_INDEX}")
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+def embed_with_cache(texts: list[str], embeddings: OpenAIEmbeddings) -> np.ndarray:
+    """
+    Obtiene los embeddings de `texts` reutilizando los ya calculados en emb_cache.sqlite.
+
+    La caché se indexa por (sha256 del texto, modelo), así que solo se envían a OpenAI los
+    chunks nuevos o modificados, en lotes de EMBED_BATCH_SIZE.
+
+    Args:
+        texts (list[str]): Textos a convertir en vectores.
+        embeddings (OpenAIEmbeddings): Cliente de embeddings.
+
+    Returns:
+        np.ndarray: Matriz float32 de forma (len(texts), dim) en el mismo orden que `texts`.
+    """
+    model = embeddings.model
+    hashes = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+    EMB_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with sqlite3.connect(EMB_CACHE_PATH) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                vec BLOB NOT NULL,
+                PRIMARY KEY (hash, model)
+            )
+        """)
+
+        # Leer en bloque los vectores ya calculados
+        cached: dict[str, np.ndarray] = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique_hashes), SQL_BATCH_SIZE):
+            batch = unique_hashes[start:start + SQL_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT hash, vec FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                (model, *batch)
+            )
+            for h, vec in rows:
+                cached[h] = np.frombuffer(vec, dtype=np.float32)
+
+        # Calcular solo los que faltan
+        missing = {h: text for h, text in zip(hashes, texts) if h not in cached}
+        print(f"Embeddings en caché: {len(unique_hashes) - len(missing)}, nuevos: {len(missing)}")
+        missing_items = list(missing.items())
+        for start in range(0, len(missing_items), EMBED_BATCH_SIZE):
+            batch = missing_items[start:start + EMBED_BATCH_SIZE]
+            vecs = np.asarray(embeddings.embed_documents([text for _, text in batch]), dtype=np.float32)
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (hash, model, vec) VALUES (?, ?, ?)",
+                [(h, model, vec.tobytes()) for (h, _), vec in zip(batch, vecs)]
+            )
+            cached.update((h, vec) for (h, _), vec in zip(batch, vecs))
+        conn.commit()
+
+    return np.stack([cached[h] for h in hashes])
+
 def run_embed_and_index():
     """
     Genera embeddings para los chunks y crea un vector store con FAISS.
@@ -46,8 +150,15 @@ def run_embed_and_index():
     # Instanciar embeddings
     embeddings = OpenAIEmbeddings(api_key=SecretStr(api_key))
 
-    # Crear vector store
-    vectordb = FAISS.from_documents(docs, embeddings)
+    # Generar embeddings y crear vector store
+    vectors = embed_with_cache([doc.page_content for doc in docs], embeddings)
+    ids = [doc.metadata["id"] for doc in docs]
+    vectordb = FAISS(
+        embedding_function=embeddings,
+        index=build_index(vectors),
+        docstore=InMemoryDocstore(dict(zip(ids, docs))),
+        index_to_docstore_id=dict(enumerate(ids))
+    )
 
     # Guardar en disco
     VECTOR_DIR.mkdir(parents=True, exist_ok=True)
@@ -1,5 +1,3 @@
-import subprocess
-import sys
 from .chunk import create_chunks
 from .embed_and_index import run_embed_and_index
 
@@ -32,15 +30,11 @@ def run_pipeline(test_search: bool = False):
     if test_search:
         print("Ejecutando pruebas de búsqueda...")
         try:
-            result = subprocess.run(
-                [sys.executable, "-m", "src.agent.agent_core"],
-                capture_output=True,
-                text=True
-            )
+            # En el mismo proceso: evita reimportar langchain y recargar el vector store
+            from src.agent.agent_core import run_test_consultas
+
             print("Resultados de búsqueda:")
-            print(result.stdout)
-            if result.stderr:
-                print(f"Errores en búsqueda: {result.stderr}")
+            run_test_consultas()
         except Exception as e:
             print(f"Error en pruebas de búsqueda: {e}")
 
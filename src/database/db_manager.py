@@ -1,25 +1,85 @@
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional
 
 DATA_DIR = Path("data/processed")
+APP_DB = DATA_DIR / "app.db"
+# Bases de datos anteriores (una por tabla); sus filas se copian a app.db la primera vez
 ORDERS_DB = DATA_DIR / "orders.db"
 INTERACTIONS_DB = DATA_DIR / "interactions.db"
 
 class DatabaseManager:
     """
-    Gestiona las bases de datos SQLite para pedidos e interacciones.
+    Gestiona la base de datos SQLite (app.db) con las tablas de pedidos e interacciones.
+
+    Mantiene conexiones de larga duración: una única conexión de escritura protegida por un lock
+    y un pool de conexiones de lectura. Al compartir archivo, un pedido y su interacción se
+    confirman con un solo commit.
     """
-    def __init__(self):
+    def __init__(self, read_pool_size: int | None = None):
         DATA_DIR.mkdir(parents=True, exist_ok=True)
+        self._write_conn = self._connect()
+        self._write_lock = threading.RLock()
         self._init_orders_db()
         self._init_interactions_db()
+        self._migrate_legacy_db(ORDERS_DB, "orders")
+        self._migrate_legacy_db(INTERACTIONS_DB, "interactions")
+        self._read_pool: queue.Queue[sqlite3.Connection] = queue.Queue()
+        for _ in range(read_pool_size or os.cpu_count() or 1):
+            self._read_pool.put(self._connect(readonly=True))
+
+    @staticmethod
+    def _connect(readonly: bool = False) -> sqlite3.Connection:
+        """
+        Abre una conexión SQLite configurada para escrituras frecuentes y pequeñas.
+
+        WAL evita que los lectores bloqueen al escritor y synchronous=NORMAL reduce los
+        fsync por transacción sin perder consistencia. Las transacciones se abren explícitamente
+        (isolation_level=None) para que cada escritura haga un único BEGIN/COMMIT.
+        """
+        conn = sqlite3.connect(APP_DB, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=5000")
+        if readonly:
+            conn.execute("PRAGMA query_only=1")
+            return conn
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    @contextmanager
+    def _writer(self) -> Iterator[sqlite3.Connection]:
+        """Entrega la conexión de escritura dentro de una transacción, serializando escritores."""
+        with self._write_lock:
+            conn = self._write_conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                # Si falla el COMMIT (p. ej. "database is locked") la transacción sigue abierta
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        """Toma una conexión de lectura del pool y la devuelve al terminar."""
+        conn = self._read_pool.get()
+        try:
+            yield conn
+        finally:
+            self._read_pool.put(conn)
 
     def _init_orders_db(self):
-        """Inicializa la base de datos de pedidos."""
-        with sqlite3.connect(ORDERS_DB) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
+        """Crea la tabla de pedidos si no existe."""
+        with self._writer() as conn:
+            conn.execute("""
                 CREATE TABLE IF NOT EXISTS orders (
                     order_id INTEGER PRIMARY KEY AUTOINCREMENT,
                     product_id TEXT NOT NULL,
@@ -28,13 +88,11 @@ class DatabaseManager:
                     status TEXT NOT NULL
                 )
             """)
-            conn.commit()
 
     def _init_interactions_db(self):
-        """Inicializa la base de datos de interacciones."""
-        with sqlite3.connect(INTERACTIONS_DB) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
+        """Crea la tabla de interacciones si no existe."""
+        with self._writer() as conn:
+            conn.execute("""
                 CREATE TABLE IF NOT EXISTS interactions (
                     interaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
                     query TEXT NOT NULL,
@@ -42,68 +100,145 @@ class DatabaseManager:
                     timestamp TEXT NOT NULL
                 )
             """)
-            conn.commit()
+
+    def _migrate_legacy_db(self, path: Path, table: str):
+        """
+        Copia las filas de una base de datos anterior a app.db si la tabla destino está vacía.
+
+        Args:
+            path (Path): Archivo SQLite anterior (orders.db o interactions.db).
+            table (str): Tabla a copiar; tiene el mismo esquema en ambos archivos.
+        """
+        conn = self._write_conn
+        if not path.exists() or conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+            return
+        with self._write_lock:
+            conn.execute("ATTACH DATABASE ? AS legacy", (str(path),))
+            try:
+                with self._writer():
+                    # Se vuelve a comprobar dentro de la transacción: otro proceso pudo migrar antes
+                    if (conn.execute("SELECT 1 FROM legacy.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+                            and not conn.execute(f"SELECT 1 FROM main.{table} LIMIT 1").fetchone()):
+                        conn.execute(f"INSERT INTO main.{table} SELECT * FROM legacy.{table}")
+            finally:
+                conn.execute("DETACH DATABASE legacy")
+
+    def close(self):
+        """Cierra la conexión de escritura y las conexiones del pool de lectura."""
+        self._write_conn.close()
+        while not self._read_pool.empty():
+            self._read_pool.get_nowait().close()
 
     def add_order(self, product_id: str, quantity: int, status: str = "pendiente") -> int:
         """
-        Añade un nuevo pedido a orders.db.
-        
+        Añade un nuevo pedido.
+
         Args:
             product_id (str): ID del producto desde catalog.json.
             quantity (int): Cantidad solicitada.
             status (str): Estado del pedido (default: 'pendiente').
-        
+
         Returns:
             int: ID del pedido creado.
         """
-        with sqlite3.connect(ORDERS_DB) as conn:
-            cursor = conn.cursor()
+        with self._writer() as conn:
             timestamp = datetime.now().isoformat()
-            cursor.execute(
+            cursor = conn.execute(
                 "INSERT INTO orders (product_id, quantity, timestamp, status) VALUES (?, ?, ?, ?)",
                 (product_id, quantity, timestamp, status)
             )
-            conn.commit()
             if cursor.lastrowid is None:
                 raise RuntimeError("Failed to insert order and retrieve lastrowid.")
             return cursor.lastrowid
 
     def add_interaction(self, query: str, response: str) -> int:
         """
-        Añade una nueva interacción a interactions.db.
-        
+        Añade una nueva interacción.
+
         Args:
             query (str): Consulta del usuario.
             response (str): Respuesta del agente.
-        
+
         Returns:
             int: ID de la interacción creada.
         """
-        with sqlite3.connect(INTERACTIONS_DB) as conn:
-            cursor = conn.cursor()
+        with self._writer() as conn:
             timestamp = datetime.now().isoformat()
-            cursor.execute(
+            cursor = conn.execute(
                 "INSERT INTO interactions (query, response, timestamp) VALUES (?, ?, ?)",
                 (query, response, timestamp)
             )
-            conn.commit()
             if cursor.lastrowid is None:
                 raise RuntimeError("Failed to insert order and retrieve lastrowid.")
             return cursor.lastrowid
 
+    def add_interactions(self, rows: Iterable[tuple[str, str]]) -> int:
+        """
+        Añade varias interacciones en una sola transacción.
+
+        Args:
+            rows (Iterable[tuple[str, str]]): Pares (consulta, respuesta).
+
+        Returns:
+            int: Número de interacciones insertadas.
+        """
+        timestamp = datetime.now().isoformat()
+        with self._writer() as conn:
+            cursor = conn.executemany(
+                "INSERT INTO interactions (query, response, timestamp) VALUES (?, ?, ?)",
+                ((query, response, timestamp) for query, response in rows)
+            )
+            return cursor.rowcount
+
+    def add_interaction_and_order(
+        self,
+        query: str,
+        product_id: str,
+        quantity: int,
+        format_response: Callable[[int], str],
+        status: str = "pendiente"
+    ) -> tuple[int, str]:
+        """
+        Registra un pedido y la interacción que lo generó en una sola transacción.
+
+        Args:
+            query (str): Consulta del usuario.
+            product_id (str): ID del producto desde catalog.json.
+            quantity (int): Cantidad solicitada.
+            format_response (Callable[[int], str]): Construye la respuesta a partir del ID del pedido.
+            status (str): Estado del pedido (default: 'pendiente').
+
+        Returns:
+            tuple[int, str]: ID del pedido creado y respuesta registrada.
+        """
+        with self._writer() as conn:
+            timestamp = datetime.now().isoformat()
+            cursor = conn.execute(
+                "INSERT INTO orders (product_id, quantity, timestamp, status) VALUES (?, ?, ?, ?)",
+                (product_id, quantity, timestamp, status)
+            )
+            if cursor.lastrowid is None:
+                raise RuntimeError("Failed to insert order and retrieve lastrowid.")
+            order_id = cursor.lastrowid
+            response = format_response(order_id)
+            conn.execute(
+                "INSERT INTO interactions (query, response, timestamp) VALUES (?, ?, ?)",
+                (query, response, timestamp)
+            )
+            return order_id, response
+
     def get_order(self, order_id: int) -> dict | None:
         """
         Obtiene un pedido por su ID.
-        
+
         Args:
             order_id (int): ID del pedido.
-        
+
         Returns:
             dict: Detalles del pedido, o None si no existe.
         """
-        with sqlite3.connect(ORDERS_DB) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM orders WHERE order_id = ?", (order_id,))
+        with self._reader() as conn:
+            cursor = conn.execute("SELECT * FROM orders WHERE order_id = ?", (order_id,))
             row = cursor.fetchone()
             if row:
                 return {
@@ -118,16 +253,15 @@ class DatabaseManager:
     def get_interaction(self, interaction_id: int) -> dict | None:
         """
         Obtiene una interacción por su ID.
-        
+
         Args:
             interaction_id (int): ID de la interacción.
-        
+
         Returns:
             dict: Detalles de la interacción, o None si no existe.
         """
-        with sqlite3.connect(INTERACTIONS_DB) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM interactions WHERE interaction_id = ?", (interaction_id,))
+        with self._reader() as conn:
+            cursor = conn.execute("SELECT * FROM interactions WHERE interaction_id = ?", (interaction_id,))
             row = cursor.fetchone()
             if row:
                 return {
@@ -138,6 +272,23 @@ class DatabaseManager:
                 }
         return None
 
+# DatabaseManager compartido por el proceso, creado una sola vez bajo lock
+_DB: Optional[DatabaseManager] = None
+_db_lock = threading.Lock()
+
+def get_db_manager() -> DatabaseManager:
+    """
+    Devuelve el DatabaseManager compartido por el proceso.
+    Hilos concurrentes en la primera llamada obtienen la misma instancia (una sola conexión
+    de escritura y una sola migración).
+    """
+    global _DB
+    if _DB is None:
+        with _db_lock:
+            if _DB is None:
+                _DB = DatabaseManager()
+    return _DB
+
 if __name__ == "__main__":
     # Prueba básica
     db = DatabaseManager()
@@ -148,4 +299,4 @@ if __name__ == "__main__":
     order = db.get_order(order_id)
     print(f"Pedido recuperado: {order}")
     interaction = db.get_interaction(interaction_id)
-    print(f"Interacción recuperada: {interaction}")
\ No newline at end of file
+    print(f"Interacción recuperada: {interaction}")
@@ -1 +1,82 @@
- 
+import json
+import pytest
+from pathlib import Path
+from src.agent import agent_core
+from src.agent.agent_core import TEST_CONSULTAS, _route, _tokenize
+
+FAQS_PATH = Path(__file__).resolve().parent.parent / "data" / "processed" / "faqs.json"
+
+def _categorias(consulta: str) -> set[str]:
+    return _route(_tokenize(consulta.lower()))
+
+@pytest.mark.parametrize(
+    "pregunta",
+    [faq["pregunta"] for faq in json.loads(FAQS_PATH.read_text("utf-8"))["faqs"]]
+)
+def test_preguntas_de_faqs_se_enrutan_a_faq(pregunta):
+    assert "faq" in _categorias(pregunta)
+
+@pytest.mark.parametrize("consulta, categoria", [
+    ("¿Hacen reservaciones?", "faq"),
+    ("¿Dónde están ubicados?", "faq"),
+    ("¿Tienen panadería?", "producto"),
+    ("¿Tienen galletas?", "producto"),
+    ("Quiero 2 croissants", "pedido"),
+])
+def test_palabras_derivadas_se_enrutan_por_prefijo(consulta, categoria):
+    assert categoria in _categorias(consulta)
+
+def test_consultas_de_prueba_mantienen_su_enrutamiento():
+    horarios, gluten, torta, croissants, pedido_torta, clima, postre = TEST_CONSULTAS
+    assert _categorias(horarios) == {"faq"}
+    assert _categorias(gluten) == {"faq"}
+    assert _categorias(torta) == {"producto"}
+    assert _categorias(croissants) == {"pedido", "producto"}
+    assert _categorias(pedido_torta) == {"pedido", "producto"}
+    assert _categorias(clima) == set()
+    assert _categorias(postre) == set()
+
+def test_cached_search_recuerda_solo_busquedas_sin_resultado():
+    agent_core.clear_caches()
+    calls = []
+
+    def search_sin_resultado():
+        calls.append("miss")
+        return None
+
+    assert agent_core._cached_search("faq", "¿Hacen reservas?", search_sin_resultado) is None
+    assert agent_core._cached_search("faq", "hacen  RESERVAS", search_sin_resultado) is None
+    assert calls == ["miss"]
+
+    def search_con_resultado():
+        calls.append("hit")
+        return "respuesta"
+
+    assert agent_core._cached_search("producto", "torta", search_con_resultado) == "respuesta"
+    assert agent_core._cached_search("producto", "torta", search_con_resultado) == "respuesta"
+    assert calls == ["miss", "hit", "hit"]
+
+    agent_core.clear_caches()
+    assert agent_core._cached_search("faq", "¿Hacen reservas?", search_sin_resultado) is None
+    assert calls == ["miss", "hit", "hit", "miss"]
+
+class _Mensaje:
+    def __init__(self, type: str, content: str):
+        self.type = type
+        self.content = content
+
+def test_format_context_conserva_orden_y_prefijos():
+    messages = [_Mensaje("human", "hola"), _Mensaje("ai", "¡Hola!"), _Mensaje("human", "¿Tienen torta?")]
+    assert agent_core._format_context(messages) == "User: hola\nAI: ¡Hola!\nUser: ¿Tienen torta?"
+
+def test_format_context_prioriza_los_mensajes_recientes():
+    messages = [_Mensaje("human", f"mensaje {i}") for i in range(100)]
+    context = agent_core._format_context(messages, budget=50)
+    lines = context.split("\n")
+    assert lines[-1] == "User: mensaje 99"
+    assert "User: mensaje 0" not in lines
+    # Se detiene en el primer mensaje que alcanza el presupuesto
+    assert sum(len(line) + 1 for line in lines[1:]) < 50 <= sum(len(line) + 1 for line in lines)
+
+def test_format_context_vacio():
+    assert agent_core._format_context([]) == ""
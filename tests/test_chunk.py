@@ -0,0 +1,53 @@
+import shutil
+import orjson
+import pytest
+from pathlib import Path
+from src.chunking import chunk
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data" / "processed"
+
+@pytest.fixture
+def processed_dir(tmp_path, monkeypatch):
+    """Copia faqs.json y catalog.json a un directorio temporal y apunta chunk.py a él."""
+    for name in ("faqs.json", "catalog.json"):
+        shutil.copy(DATA_DIR / name, tmp_path / name)
+    monkeypatch.setattr(chunk, "PROCESSED_DIR", tmp_path)
+    monkeypatch.setattr(chunk, "CHUNKS_PATH", tmp_path / "chunks.jsonl")
+    monkeypatch.setattr(chunk, "CHUNKS_HASH_PATH", tmp_path / "chunks.hash")
+    monkeypatch.setattr(chunk, "FAQS_PATH", tmp_path / "faqs.json")
+    monkeypatch.setattr(chunk, "CATALOG_PATH", tmp_path / "catalog.json")
+    return tmp_path
+
+def _ids(path: Path) -> list[str]:
+    return [orjson.loads(line)["id"] for line in path.read_bytes().splitlines()]
+
+def test_chunks_incluyen_faqs_y_productos(processed_dir):
+    chunk.create_chunks()
+    ids = _ids(processed_dir / "chunks.jsonl")
+    assert any(chunk_id.startswith("faq-") for chunk_id in ids)
+    assert any(chunk_id.startswith("producto-") for chunk_id in ids)
+
+def test_no_regenera_si_las_entradas_no_cambian(processed_dir):
+    chunks_path = processed_dir / "chunks.jsonl"
+    chunk.create_chunks()
+    chunks_path.write_bytes(b"sentinela\n")
+
+    chunk.create_chunks()
+    assert chunks_path.read_bytes() == b"sentinela\n"
+
+    chunk.create_chunks(force=True)
+    assert chunks_path.read_bytes() != b"sentinela\n"
+    assert _ids(chunks_path)
+
+def test_regenera_si_cambian_las_faqs(processed_dir):
+    chunks_path = processed_dir / "chunks.jsonl"
+    chunk.create_chunks()
+    chunks_path.write_bytes(b"sentinela\n")
+
+    faqs_path = processed_dir / "faqs.json"
+    data = orjson.loads(faqs_path.read_bytes())
+    data["faqs"].append({"pregunta": "¿Tienen pan de yuca?", "respuesta": "Sí, los fines de semana."})
+    faqs_path.write_bytes(orjson.dumps(data))
+
+    chunk.create_chunks()
+    assert f"faq-{len(data['faqs']) - 1}" in _ids(chunks_path)
@@ -0,0 +1,128 @@
+import threading
+import pytest
+from src.database import db_manager
+
+@pytest.fixture(autouse=True)
+def tmp_db(tmp_path, monkeypatch):
+    """Apunta las rutas de la base de datos a un directorio temporal."""
+    monkeypatch.setattr(db_manager, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(db_manager, "APP_DB", tmp_path / "app.db")
+    monkeypatch.setattr(db_manager, "ORDERS_DB", tmp_path / "orders.db")
+    monkeypatch.setattr(db_manager, "INTERACTIONS_DB", tmp_path / "interactions.db")
+    monkeypatch.setattr(db_manager, "_DB", None)
+    yield tmp_path
+    if db_manager._DB is not None:
+        db_manager._DB.close()
+
+def test_get_db_manager_devuelve_una_sola_instancia_entre_hilos():
+    barrier = threading.Barrier(8)
+    instances = []
+
+    def worker():
+        barrier.wait()
+        instances.append(db_manager.get_db_manager())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(instances) == 8
+    assert len({id(instance) for instance in instances}) == 1
+
+def _falla(order_id: int) -> str:
+    raise RuntimeError("fallo al construir la respuesta")
+
+def test_writer_revierte_la_transaccion_si_falla():
+    db = db_manager.get_db_manager()
+    with pytest.raises(RuntimeError):
+        db.add_interaction_and_order(
+            "Quiero 2 croissants",
+            product_id="1",
+            quantity=2,
+            format_response=_falla
+        )
+    assert db.get_order(1) is None
+    assert db.get_interaction(1) is None
+    # La conexión de escritura queda lista para la siguiente transacción
+    order_id = db.add_order(product_id="1", quantity=2)
+    assert db.get_order(order_id)["quantity"] == 2
+
+def test_writer_revierte_si_falla_el_commit():
+    db = db_manager.get_db_manager()
+    # Una FK diferida solo se comprueba en el COMMIT, que falla y deja la transacción abierta
+    db._write_conn.execute("PRAGMA foreign_keys=ON")
+    with db._writer() as conn:
+        conn.execute("CREATE TABLE padre (id INTEGER PRIMARY KEY)")
+        conn.execute(
+            "CREATE TABLE hijo (padre_id INTEGER REFERENCES padre(id) DEFERRABLE INITIALLY DEFERRED)"
+        )
+    with pytest.raises(db_manager.sqlite3.IntegrityError):
+        with db._writer() as conn:
+            conn.execute("INSERT INTO hijo VALUES (1)")
+    assert not db._write_conn.in_transaction
+    assert db.add_interaction("¿Tienen torta?", "Sí.") == 1
+
+def _crear_bases_anteriores(tmp_path):
+    with db_manager.sqlite3.connect(tmp_path / "orders.db") as conn:
+        conn.execute(
+            "CREATE TABLE orders (order_id INTEGER PRIMARY KEY AUTOINCREMENT, product_id TEXT NOT NULL, "
+            "quantity INTEGER NOT NULL, timestamp TEXT NOT NULL, status TEXT NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT INTO orders (product_id, quantity, timestamp, status) VALUES (?, ?, ?, ?)",
+            [("1", 2, "2024-01-01T10:00:00", "procesado"), ("3", 1, "2024-01-02T10:00:00", "pendiente")]
+        )
+    with db_manager.sqlite3.connect(tmp_path / "interactions.db") as conn:
+        conn.execute(
+            "CREATE TABLE interactions (interaction_id INTEGER PRIMARY KEY AUTOINCREMENT, query TEXT NOT NULL, "
+            "response TEXT NOT NULL, timestamp TEXT NOT NULL)"
+        )
+        conn.execute(
+            "INSERT INTO interactions (query, response, timestamp) VALUES (?, ?, ?)",
+            ("¿Tienen torta?", "Sí.", "2024-01-01T10:00:00")
+        )
+
+def _contar(db, table: str) -> int:
+    with db._reader() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def test_migra_las_bases_anteriores_una_sola_vez(tmp_db):
+    _crear_bases_anteriores(tmp_db)
+    db_manager.DatabaseManager(read_pool_size=1).close()
+    db = db_manager.DatabaseManager(read_pool_size=1)
+    try:
+        assert _contar(db, "orders") == 2
+        assert _contar(db, "interactions") == 1
+        assert db.get_order(2)["product_id"] == "3"
+        # Los IDs nuevos continúan después de los migrados
+        assert db.add_order(product_id="1", quantity=1) == 3
+    finally:
+        db.close()
+
+def test_migracion_concurrente_no_duplica_filas(tmp_db):
+    _crear_bases_anteriores(tmp_db)
+    barrier = threading.Barrier(4)
+    errors = []
+
+    def worker():
+        barrier.wait()
+        try:
+            db_manager.DatabaseManager(read_pool_size=1).close()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    db = db_manager.DatabaseManager(read_pool_size=1)
+    try:
+        assert _contar(db, "orders") == 2
+        assert _contar(db, "interactions") == 1
+    finally:
+        db.close()
@@ -0,0 +1,36 @@
+from src.agent import query_cache
+from src.agent.query_cache import QueryCache
+
+def test_get_devuelve_default_si_no_existe():
+    cache = QueryCache()
+    marker = object()
+    assert cache.get("nada") is None
+    assert cache.get("nada", marker) is marker
+
+def test_descarta_la_entrada_menos_reciente():
+    cache = QueryCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "a" pasa a ser la más reciente
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+def test_expira_tras_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: now[0])
+    cache = QueryCache(ttl_seconds=10)
+    cache.put("a", 1)
+    now[0] += 10
+    assert cache.get("a") == 1
+    now[0] += 0.1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_clear():
+    cache = QueryCache()
+    cache.put("a", 1)
+    cache.clear()
+    assert len(cache) == 0